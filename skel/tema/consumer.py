@@ -3,7 +3,6 @@ Consumer
 """
 
 from threading import Thread
-from time import sleep
 
 
 class Consumer(Thread):
@@ -49,8 +48,9 @@ class Consumer(Thread):
 
                 if operation_type == "add":
                     for _ in range(quantity):
-                        while not self.marketplace.add_to_cart(cart_id, product):
-                            sleep(self.retry_wait_time)
+                        while not self.marketplace.add_to_cart_blocking(
+                                cart_id, product, self.retry_wait_time):
+                            pass
                 elif operation_type == "remove":
                     for _ in range(quantity):
                         self.marketplace.remove_from_cart(cart_id, product)
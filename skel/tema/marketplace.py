@@ -2,13 +2,123 @@
 Marketplace
 """
 import json
+import queue
 import time
 import unittest
-from threading import Lock, RLock
+from threading import Condition, Lock
 import logging
-from logging.handlers import RotatingFileHandler
-from collections import defaultdict
-import heapq
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from collections import defaultdict, deque
+
+_LOG_LISTENER = None
+
+
+def _setup_logger():
+    """
+    Configure 'my_logger' once per process. Every Marketplace used to
+    attach a fresh handler to this shared logger, so each extra instance
+    (e.g. across unit tests) multiplied the writes per record.
+    """
+    # pylint: disable=global-statement
+    global _LOG_LISTENER
+    logger = logging.getLogger('my_logger')
+    if logger.handlers:
+        return logger
+
+    logger.setLevel(logging.INFO)
+    handler = RotatingFileHandler("marketplace.log", maxBytes=1024 * 512, backupCount=20)
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s',
+                                  datefmt='%Y-%m-%d %H:%M:%S')
+    handler.setFormatter(formatter)
+    formatter.converter = time.gmtime
+    # Producer/consumer threads only enqueue records; the listener
+    # thread owns the RotatingFileHandler and does the file I/O.
+    log_q = queue.Queue(-1)
+    logger.addHandler(QueueHandler(log_q))
+    _LOG_LISTENER = QueueListener(log_q, handler)
+    _LOG_LISTENER.start()
+    return logger
+
+
+def _shutdown_logger():
+    """
+    Stop the process-wide listener, flushing any queued records, and
+    detach the queue handler so a later _setup_logger starts fresh.
+    Safe to call more than once: QueueListener.stop() itself is not.
+    """
+    # pylint: disable=global-statement
+    global _LOG_LISTENER
+    listener, _LOG_LISTENER = _LOG_LISTENER, None
+    if listener is None:
+        return
+    listener.stop()
+    logger = logging.getLogger('my_logger')
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+
+
+class _Ring:
+    """
+    Bounded FIFO over a preallocated power-of-2 buffer: steady-state
+    append/popleft touch one slot and bump an index (masking replaces
+    modulo), with no allocation. Doubles only if a late producer
+    registration pushes the stock bound past the initial capacity.
+    """
+    __slots__ = ('buf', 'mask', 'head', 'tail')
+
+    def __init__(self, capacity):
+        cap = 1
+        while cap < capacity:
+            cap <<= 1
+        self.buf = [None] * cap
+        self.mask = cap - 1
+        self.head = 0
+        self.tail = 0
+
+    def __len__(self):
+        return self.tail - self.head
+
+    def _grow(self):
+        items = [self.buf[i & self.mask] for i in range(self.head, self.tail)]
+        cap = (self.mask + 1) << 1
+        self.buf = items + [None] * (cap - len(items))
+        self.mask = cap - 1
+        self.head = 0
+        self.tail = len(items)
+
+    def append(self, item):
+        """ Enqueue one item. """
+        if self.tail - self.head > self.mask:
+            self._grow()
+        self.buf[self.tail & self.mask] = item
+        self.tail += 1
+
+    def extend(self, items):
+        """ Enqueue several items. """
+        for item in items:
+            self.append(item)
+
+    def popleft(self):
+        """ Dequeue the oldest item. """
+        i = self.head & self.mask
+        item = self.buf[i]
+        self.buf[i] = None
+        self.head += 1
+        return item
+
+
+class _CartItem:
+    # pylint: disable=too-few-public-methods
+    """
+    Cart record: slots keep it a fraction of the size of the 2-key dict
+    it replaces, which matters for cart traversal cache density.
+    """
+    __slots__ = ('product', 'producer_id')
+
+    def __init__(self, product, producer_id):
+        self.product = product
+        self.producer_id = producer_id
+
 
 class Marketplace:
     # pylint: disable=too-many-instance-attributes
@@ -19,36 +129,35 @@ class Marketplace:
 
     def __init__(self, queue_size_per_producer):
         self.q_size = queue_size_per_producer
-        self.prod_q = {}
+        self.prod_q = []
         self.carts = {}
         self.p_id, self.c_id = 0, 0
         self.p_id_lock, self.c_id_lock = Lock(), Lock()
-        self.p_locks = defaultdict(RLock)
-        self.prod_queue = defaultdict(list)
+        self.p_locks = []
+        self.p_cv = []
+        self.prod_queue = {}
         self.prod_locks = {}
+        self.prod_cv = {}
 
-        self.logger = logging.getLogger('my_logger')
-        self.logger.setLevel(logging.INFO)
-        handler = RotatingFileHandler("marketplace.log", maxBytes=1024 * 512, backupCount=20)
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s',
-                                      datefmt='%Y-%m-%d %H:%M:%S')
-        handler.setFormatter(formatter)
-        formatter.converter = time.gmtime
-        self.logger.addHandler(handler)
+        self.logger = _setup_logger()
+        # Cached once: hot-path traces are DEBUG and skipped entirely at INFO.
+        self.log_debug = self.logger.isEnabledFor(logging.DEBUG)
 
     def register_producer(self):
         """
         Register producer.
 
         Returns:
-            p_id_str (str): The id.
+            p_id (int): The id, an index into prod_q and p_locks.
         """
         with self.p_id_lock:
-            p_id_str = f"prod{self.p_id}"
-            self.prod_q[p_id_str], self.p_locks[p_id_str] = 0, RLock()
+            p_id = self.p_id
+            self.prod_q.append(0)
+            self.p_locks.append(Lock())
+            self.p_cv.append(Condition())
             self.p_id += 1
-            self.logger.info("Registered producer: %s", p_id_str)
-        return p_id_str
+        self.logger.info("Registered producer: %s", p_id)
+        return p_id
 
     def new_cart(self):
         """
@@ -59,15 +168,25 @@ class Marketplace:
         """
         with self.c_id_lock:
             cart_id = self.c_id
-            self.carts[cart_id] = []
+            self.carts[cart_id] = self._empty_cart()
             self.c_id += 1
-            self.logger.info("New cart created: %s", cart_id)
+        self.logger.info("New cart created: %s", cart_id)
         return cart_id
 
-    def add_product_to_cart(self, c_id, prod, p_id):
-        """ Adds a product in the cart """
-        self.carts[c_id].append({"product": prod, "producer_id": p_id})
-        self.logger.info("Product added to cart: %s, %s", c_id, prod)
+    @staticmethod
+    def _empty_cart():
+        """
+        Cart storage: the insertion-ordered item list (removals leave a
+        None tombstone) plus a per-product index deque for O(1) removal.
+        """
+        return {"items": [], "by_prod": defaultdict(deque)}
+
+    def add_product_to_cart(self, cart, c_id, prod, p_id):
+        """ Adds a product in the (already fetched) cart """
+        cart["by_prod"][prod].append(len(cart["items"]))
+        cart["items"].append(_CartItem(prod, p_id))
+        if self.log_debug:
+            self.logger.debug("Product added to cart: %s, %s", c_id, prod)
 
     def add_to_cart(self, c_id, prod):
         """
@@ -80,52 +199,153 @@ class Marketplace:
         Returns:
             bool: Status.
         """
-        if c_id not in self.carts or not self.prod_queue[prod]:
-            self.logger.info("Cart or Product not available: %s, %s", c_id, prod)
+        # Under contention most calls fail on empty stock, so test that first.
+        stock = self.prod_queue.get(prod)
+        cart = self.carts.get(c_id) if stock else None
+        if not stock or cart is None:
+            if self.log_debug:
+                self.logger.debug("Cart or Product not available: %s, %s", c_id, prod)
             return False
 
-        if prod not in self.prod_locks:
-            self.prod_locks[prod] = RLock()
-
         with self.prod_locks[prod]:
-            if not self.prod_queue[prod]:
-                self.logger.info("Product not available: %s, %s", c_id, prod)
+            if not stock:
+                if self.log_debug:
+                    self.logger.debug("Product not available: %s, %s", c_id, prod)
                 return False
 
-            _, p_id = heapq.heappop(self.prod_queue[prod])
-            self.add_product_to_cart(c_id, prod, p_id)
+            p_id = stock.popleft()
+            self.add_product_to_cart(cart, c_id, prod, p_id)
         return True
 
+    def add_to_cart_blocking(self, c_id, prod, timeout=None):
+        """
+        Add to the cart, waiting until the product is restocked.
+
+        Args:
+            c_id (int): id
+            prod (Product): prod
+            timeout (float): upper bound on one restock wait, in seconds.
+
+        Returns:
+            bool: Status.
+        """
+        if self.add_to_cart(c_id, prod):
+            return True
+
+        cv = self.prod_cv.setdefault(prod, Condition())
+        with cv:
+            if not self.prod_queue.get(prod):
+                cv.wait(timeout)
+        return self.add_to_cart(c_id, prod)
+
     def publish(self, p_id, prod):
         """
         Publish product
 
         Args:
-            p_id (str): The id
+            p_id (int): The id
             prod (str): The name
 
         Returns:
             bool: Status
         """
+        # Ensure the consumer-side lock and condition exist before any
+        # stock is visible; setdefault is one atomic call, so two racing
+        # publishers cannot install two different objects.
+        lock = self.prod_locks.setdefault(prod, Lock())
+        cv = self.prod_cv.setdefault(prod, Condition())
+        stock = self.prod_queue.get(prod)
+        if stock is None:
+            # Total stock of one product is bounded by the registered
+            # producers' queue capacity.
+            stock = self.prod_queue.setdefault(prod, _Ring(self.p_id * self.q_size))
+        prod_q = self.prod_q
         with self.p_locks[p_id]:
-            q_size = self.prod_q[p_id]
-            if q_size == self.q_size:
-                self.logger.info("Publish failed: %s, %s", p_id, prod)
-                return False
+            if prod_q[p_id] == self.q_size:
+                published = False
+            else:
+                # Rings are shared per product, so mutation needs the
+                # product lock; multi-step append/_grow is not atomic.
+                with lock:
+                    stock.append(p_id)
+                prod_q[p_id] += 1
+                published = True
+        if published:
+            with cv:
+                cv.notify()
+        if self.log_debug:
+            self.logger.debug("Publish %s: %s, %s",
+                              "ok" if published else "failed", p_id, prod)
+        return published
+
+    def publish_many(self, p_id, prod, n):
+        """
+        Publish up to n units of a product under one lock acquisition.
 
-            heapq.heappush(self.prod_queue[prod], (q_size, p_id))
-            self.prod_q[p_id] += 1
-            self.logger.info("Published product: %s, %s", p_id, prod)
-        return True
+        Args:
+            p_id (int): The id
+            prod (str): The name
+            n (int): Requested quantity
+
+        Returns:
+            int: How many units were actually published.
+        """
+        lock = self.prod_locks.setdefault(prod, Lock())
+        cv = self.prod_cv.setdefault(prod, Condition())
+        stock = self.prod_queue.get(prod)
+        if stock is None:
+            stock = self.prod_queue.setdefault(prod, _Ring(self.p_id * self.q_size))
+        prod_q = self.prod_q
+        with self.p_locks[p_id]:
+            count = min(n, self.q_size - prod_q[p_id])
+            if count > 0:
+                with lock:
+                    stock.extend([p_id] * count)
+                prod_q[p_id] += count
+        if count > 0:
+            with cv:
+                cv.notify(count)
+        if self.log_debug:
+            self.logger.debug("Published %s x %s: %s", count, prod, p_id)
+        return count
+
+    def publish_many_blocking(self, p_id, prod, n, timeout=None):
+        """
+        Publish up to n units, waiting for a queue slot when full.
+
+        Args:
+            p_id (int): The id
+            prod (str): The name
+            n (int): Requested quantity
+            timeout (float): upper bound on one slot wait, in seconds.
+
+        Returns:
+            int: How many units were actually published.
+        """
+        count = self.publish_many(p_id, prod, n)
+        if count:
+            return count
+
+        cv = self.p_cv[p_id]
+        with cv:
+            if self.prod_q[p_id] == self.q_size:
+                cv.wait(timeout)
+        return self.publish_many(p_id, prod, n)
 
     def _find_and_remove(self, cart, product):
-        for i, item in enumerate(cart):
-            if item['product'] == product:
-                producer_id = item['producer_id']
-                heapq.heappush(self.prod_queue[product], (self.prod_q[producer_id], producer_id))
-                del cart[i]
-                return True
-        return False
+        indices = cart["by_prod"].get(product)
+        if not indices:
+            return False
+
+        i = indices.pop()
+        producer_id = cart["items"][i].producer_id
+        cart["items"][i] = None
+        with self.prod_locks[product]:
+            self.prod_queue[product].append(producer_id)
+        cv = self.prod_cv[product]
+        with cv:
+            cv.notify()
+        return True
 
     def remove_from_cart(self, cart_id, product):
         """
@@ -138,15 +358,16 @@ class Marketplace:
         Returns:
             bool: Status
         """
-        if cart_id not in self.carts:
+        cart = self.carts.get(cart_id)
+        if cart is None:
             self.logger.error("Cart %s does not exist.", cart_id)
             return False
 
-        cart = self.carts[cart_id]
         removed = self._find_and_remove(cart, product)
 
         if removed:
-            self.logger.info("Product %s removed from cart %s.", product, cart_id)
+            if self.log_debug:
+                self.logger.debug("Product %s removed from cart %s.", product, cart_id)
         else:
             self.logger.error("Product %s not found in cart %s.", product, cart_id)
 
@@ -162,21 +383,33 @@ class Marketplace:
         Returns:
             bool: Status
         """
-        self.logger.info("Entered place_order(%s)!", cart_id)
-        if cart_id not in self.carts:
-            self.logger.info("Finished place_order(%s): Cart doesn't exist!", cart_id)
+        cart = self.carts.get(cart_id)
+        if cart is None:
+            if self.log_debug:
+                self.logger.debug("Finished place_order(%s): Cart doesn't exist!", cart_id)
             return None
 
-        cart_list = self.carts[cart_id]
-        result = [cart_element["product"] for cart_element in cart_list]
-
+        cart_list = cart["items"]
+        result = []
+        counts = defaultdict(int)
         for cart_element in cart_list:
-            producer_id = cart_element["producer_id"]
-            with self.p_locks[producer_id]:
-                self.prod_q[producer_id] -= 1
-
-        self.carts[cart_id] = []
-        self.logger.info("Finished place_order(%s): Order placed: %s!", cart_id, result)
+            if cart_element is None:
+                continue
+            result.append(cart_element.product)
+            counts[cart_element.producer_id] += 1
+
+        p_locks, p_cv, prod_q = self.p_locks, self.p_cv, self.prod_q
+        for producer_id, n in counts.items():
+            with p_locks[producer_id]:
+                prod_q[producer_id] -= n
+            # Slots were freed: wake producers blocked on a full queue.
+            cv = p_cv[producer_id]
+            with cv:
+                cv.notify_all()
+
+        self.carts[cart_id] = self._empty_cart()
+        if self.log_debug:
+            self.logger.debug("Finished place_order(%s): Order placed: %s!", cart_id, result)
         return result
 
     def get_cart(self, cart_id):
@@ -189,15 +422,25 @@ class Marketplace:
         Returns:
             list: list of products in the cart, or None if cart doesn't exist.
         """
-        if cart_id not in self.carts:
-            self.logger.info("Cart does not exist: %s", cart_id)
+        cart = self.carts.get(cart_id)
+        if cart is None:
+            if self.log_debug:
+                self.logger.debug("Cart does not exist: %s", cart_id)
             return None
 
-        cart_list = self.carts[cart_id]
-        result = [cart_element["product"] for cart_element in cart_list]
-        self.logger.info("Cart retrieved: %s", cart_id)
+        cart_list = cart["items"]
+        result = [cart_element.product for cart_element in cart_list
+                  if cart_element is not None]
+        if self.log_debug:
+            self.logger.debug("Cart retrieved: %s", cart_id)
         return result
 
+    def close(self):
+        """
+        Shut down the shared logging machinery; idempotent.
+        """
+        _shutdown_logger()
+
 
 class TestMarketplace(unittest.TestCase):
     # pylint: disable=too-many-instance-attributes
@@ -212,11 +455,11 @@ class TestMarketplace(unittest.TestCase):
         """
         market = Marketplace(10)
         self.assertEqual(market.q_size, 10)
-        self.assertEqual(market.prod_q, {})
+        self.assertEqual(market.prod_q, [])
         self.assertEqual(market.carts, {})
         self.assertEqual(market.p_id, 0)
         self.assertEqual(market.c_id, 0)
-        self.assertEqual(market.p_locks, {})
+        self.assertEqual(market.p_locks, [])
         self.assertEqual(market.prod_locks, {})
 
     def test_register_producer(self):
@@ -224,9 +467,9 @@ class TestMarketplace(unittest.TestCase):
         Test case for the register_producer method of the Marketplace class.
         """
         market = Marketplace(10)
-        p_id_str = market.register_producer()
-        self.assertEqual(p_id_str, "prod0")
-        self.assertEqual(market.prod_q, {"prod0": 0})
+        p_id = market.register_producer()
+        self.assertEqual(p_id, 0)
+        self.assertEqual(market.prod_q, [0])
         self.assertEqual(len(market.p_locks), 1)
         self.assertEqual(len(market.prod_locks), 0)
 
@@ -235,10 +478,10 @@ class TestMarketplace(unittest.TestCase):
         Test case for the publish method of the Marketplace class.
         """
         market = Marketplace(10)
-        p_id_str = market.register_producer()
+        p_id = market.register_producer()
         prod = "product"
-        self.assertTrue(market.publish(p_id_str, prod))
-        self.assertEqual(market.prod_q, {"prod0": 1})
+        self.assertTrue(market.publish(p_id, prod))
+        self.assertEqual(market.prod_q, [1])
 
     def test_new_cart(self):
         """
@@ -247,7 +490,8 @@ class TestMarketplace(unittest.TestCase):
         market = Marketplace(10)
         c_id = market.new_cart()
         self.assertEqual(c_id, 0)
-        self.assertEqual(market.carts, {0: []})
+        self.assertEqual(market.carts[0]["items"], [])
+        self.assertEqual(market.get_cart(c_id), [])
 
     def test_add_to_cart(self):
         """
@@ -258,14 +502,14 @@ class TestMarketplace(unittest.TestCase):
 
         # Create a cart and register a producer
         c_id = market.new_cart()
-        p_id_str = market.register_producer()
+        p_id = market.register_producer()
 
         # Attempt to add a non-existent product to the cart
         prod = "product"
         self.assertFalse(market.add_to_cart(c_id, prod))
 
         # Publish the product and add it to the cart
-        market.publish(p_id_str, prod)
+        market.publish(p_id, prod)
         self.assertTrue(market.add_to_cart(c_id, prod))
 
         # Attempt to add the same product to the cart again
@@ -278,7 +522,10 @@ class TestMarketplace(unittest.TestCase):
         self.assertFalse(market.add_to_cart(-1, prod))
 
         # Check that the product was added to the cart and the producer list
-        self.assertEqual(market.carts, {0: [{"product": prod, "producer_id": "prod0"}]})
+        items = market.carts[0]["items"]
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0].product, prod)
+        self.assertEqual(items[0].producer_id, 0)
 
     def test_remove_from_cart(self):
         """
@@ -286,9 +533,9 @@ class TestMarketplace(unittest.TestCase):
         """
         market = Marketplace(10)
         c_id = market.new_cart()
-        p_id_str = market.register_producer()
+        p_id = market.register_producer()
         prod = "product"
-        market.publish(p_id_str, prod)
+        market.publish(p_id, prod)
         market.add_to_cart(c_id, prod)
 
         # Attempt to remove a non-existent product from the cart
@@ -296,7 +543,7 @@ class TestMarketplace(unittest.TestCase):
 
         # Remove a product from the cart
         self.assertTrue(market.remove_from_cart(c_id, prod))
-        self.assertEqual(market.carts, {0: []})
+        self.assertEqual(market.get_cart(c_id), [])
 
     def test_place_order(self):
         """
@@ -304,9 +551,9 @@ class TestMarketplace(unittest.TestCase):
         """
         market = Marketplace(10)
         c_id = market.new_cart()
-        p_id_str = market.register_producer()
+        p_id = market.register_producer()
         prod = "product"
-        market.publish(p_id_str, prod)
+        market.publish(p_id, prod)
         market.add_to_cart(c_id, prod)
 
         # Attempt to place an order with a non-existent cart
@@ -315,23 +562,23 @@ class TestMarketplace(unittest.TestCase):
         # Place an order
         order = market.place_order(c_id)
         self.assertEqual(order, [prod])
-        self.assertEqual(market.prod_q, {"prod0": 0})
-        self.assertEqual(market.carts, {0: []})
+        self.assertEqual(market.prod_q, [0])
+        self.assertEqual(market.get_cart(c_id), [])
 
         # Attempt to place another order with an empty cart
         self.assertEqual(market.place_order(c_id), [])
-        self.assertEqual(market.prod_q, {"prod0": 0})
-        self.assertEqual(market.carts, {0: []})
+        self.assertEqual(market.prod_q, [0])
+        self.assertEqual(market.get_cart(c_id), [])
 
         # Publish another product
         prod2 = "product2"
-        market.publish(p_id_str, prod2)
+        market.publish(p_id, prod2)
         market.add_to_cart(c_id, prod2)
 
         # Place another order
         order = market.place_order(c_id)
         self.assertEqual(order, [prod2])
-        self.assertEqual(market.carts, {0: []})
+        self.assertEqual(market.get_cart(c_id), [])
 
 
 # Attention. You have to run manually each one
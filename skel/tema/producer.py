@@ -30,5 +30,7 @@ class Producer(Thread):
             for prod, qty, prod_time in self.prod_data:
                 sleep(prod_time)
 
-                while not all(self.market_place.publish(p_id, prod) for _ in range(qty)):
-                    sleep(self.wait_time)
+                remaining = qty
+                while remaining:
+                    remaining -= self.market_place.publish_many_blocking(
+                        p_id, prod, remaining, self.wait_time)
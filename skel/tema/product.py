@@ -2,30 +2,67 @@
 Product
 """
 
-from dataclasses import dataclass
 
-
-@dataclass(init=True, repr=True, order=False, frozen=True)
 class Product:
     """
     Product.
+
+    Immutable record with the hash precomputed at construction:
+    products key the marketplace's hottest dicts, and the generated
+    frozen-dataclass __hash__ re-tupled every field on each lookup.
+    repr/eq/frozen semantics match the dataclass it replaces.
     """
-    name: str
-    price: int
+    __slots__ = ('name', 'price', '_hash')
+    _fields = ('name', 'price')
+
+    def __init__(self, name, price):
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'price', price)
+        object.__setattr__(self, '_hash',
+                           hash(tuple(getattr(self, f) for f in self._fields)))
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"cannot assign to field {key!r}")
+
+    def __delattr__(self, key):
+        raise AttributeError(f"cannot delete field {key!r}")
+
+    def __hash__(self):
+        # _hash is set through object.__setattr__, which pylint cannot trace.
+        return self._hash  # pylint: disable=no-member
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self._fields)
+
+    def __repr__(self):
+        args = ', '.join(f'{f}={getattr(self, f)!r}' for f in self._fields)
+        return f'{type(self).__name__}({args})'
 
 
-@dataclass(init=True, repr=True, order=False, frozen=True)
 class Tea(Product):
+    # pylint: disable=too-few-public-methods
     """
     Tea products
     """
-    type: str
+    __slots__ = ('type',)
+    _fields = ('name', 'price', 'type')
+
+    def __init__(self, name, price, type):  # pylint: disable=redefined-builtin
+        object.__setattr__(self, 'type', type)
+        super().__init__(name, price)
 
 
-@dataclass(init=True, repr=True, order=False, frozen=True)
 class Coffee(Product):
+    # pylint: disable=too-few-public-methods
     """
     Coffee products
     """
-    acidity: str
-    roast_level: str
+    __slots__ = ('acidity', 'roast_level')
+    _fields = ('name', 'price', 'acidity', 'roast_level')
+
+    def __init__(self, name, price, acidity, roast_level):
+        object.__setattr__(self, 'acidity', acidity)
+        object.__setattr__(self, 'roast_level', roast_level)
+        super().__init__(name, price)